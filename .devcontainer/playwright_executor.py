@@ -3,30 +3,46 @@ from playwright.async_api import async_playwright
 import argparse
 from datetime import datetime
 import os
+import sys
 import json
 from pathlib import Path
 import tempfile
 import base64
+import importlib.util
+import re
 
-async def execute_playwright_script(url: str, script: str, output_dir: str = ".screenshots", capture_logs: bool = False):
-    """
-    Executes a Playwright script and captures outputs.
-    """
-    # Create output directory
-    
-    automation_output_dir = 'automation_output'
+SCREENSHOT_MODES = ("always", "on-error", "none")
 
-    os.makedirs(output_dir, exist_ok=True)
-    os.makedirs(automation_output_dir, exist_ok=True)
+# Collects Web Vitals from PerformanceObservers installed before any page script runs
+WEB_VITALS_INIT_SCRIPT = """
+window.__webVitals = {lcp: null, fcp: null, cls: 0};
+(() => {
+    const observe = (type, callback) => {
+        try {
+            new PerformanceObserver(list => list.getEntries().forEach(callback)).observe({type, buffered: true});
+        } catch (e) {}
+    };
+    observe('largest-contentful-paint', e => { window.__webVitals.lcp = e.renderTime || e.loadTime || e.startTime; });
+    observe('paint', e => { if (e.name === 'first-contentful-paint') window.__webVitals.fcp = e.startTime; });
+    observe('layout-shift', e => { if (!e.hadRecentInput) window.__webVitals.cls += e.value; });
+})();
+"""
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    run_dir = Path(automation_output_dir) / timestamp
-    run_dir.mkdir(exist_ok=True)
+NAVIGATION_TIMING_SCRIPT = """() => {
+    const nav = performance.getEntriesByType('navigation')[0];
+    if (!nav) return null;
+    return {
+        ttfb_ms: nav.responseStart - nav.startTime,
+        dom_content_loaded_ms: nav.domContentLoadedEventEnd - nav.startTime,
+        load_ms: nav.loadEventEnd - nav.startTime,
+        transfer_size: nav.transferSize,
+        encoded_body_size: nav.encodedBodySize,
+        decoded_body_size: nav.decodedBodySize
+    };
+}"""
 
-    screenshot_dir = Path(output_dir)
-    screenshot_dir.mkdir(exist_ok=True)
-    
-    result = {
+def _new_result():
+    return {
         "status": "success",
         "data": {
             "screenshots": [],
@@ -36,136 +52,299 @@ async def execute_playwright_script(url: str, script: str, output_dir: str = ".s
         }
     }
 
+async def _save_screenshot(page, paths):
+    """Capture one full-page screenshot and write it to every path"""
+    image = await page.screenshot(full_page=True, type="jpeg", quality=50)
+    for path in paths:
+        with open(path, "wb") as f:
+            f.write(image)
+
+def _job_dir_name(index: int, job_id: str) -> str:
+    """Unique, filesystem-safe directory name for a batch job"""
+    safe_id = re.sub(r"[^A-Za-z0-9_-]+", "_", job_id).strip("_")[:64]
+    return f"{index:04d}_{safe_id}" if safe_id else f"{index:04d}"
+
+async def _request_record(request):
+    """Timing and size details for a finished network request"""
+    response = await request.response()
+    timing = request.timing
+    record = {
+        "url": request.url,
+        "method": request.method,
+        "resource_type": request.resource_type,
+        "status": response.status if response else None,
+        "duration_ms": timing["responseEnd"] if timing.get("responseEnd", -1) >= 0 else None,
+        "timing": timing,
+    }
     try:
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True)
-            context = await browser.new_context()
-            page = await context.new_page()
-            
-            # Store console logs if requested
-            console_logs = []
-            if capture_logs:
-                page.on("console", lambda msg: console_logs.append(f"{msg.type}: {msg.text}"))
-            
-            try:
-                # Navigate to URL first
-                await page.goto(url, wait_until="networkidle", timeout=30000)
-                
-                # Decode script if base64 encoded
-                if script.startswith('base64:'):
-                    script = base64.b64decode(script[7:]).decode('utf-8')
-                
-                # Add proper indentation to the script
-                indented_script = ""
-                for line in script.split('\n'):
-                    if line.strip():
-                        indented_script += "    " + line + "\n"
-                    else:
-                        indented_script += "\n"
-                
-                # Create test script with proper indentation
-                test_script = f"""async def run_test(page, output_dir):
+        record.update(await request.sizes())
+    except Exception:
+        pass
+    return record
+
+def _network_summary(requests):
+    by_type = {}
+    for record in requests:
+        stats = by_type.setdefault(record["resource_type"], {"count": 0, "response_bytes": 0})
+        stats["count"] += 1
+        stats["response_bytes"] += record.get("responseBodySize") or 0
+    return {
+        "count": len(requests),
+        "total_response_bytes": sum(stats["response_bytes"] for stats in by_type.values()),
+        "by_resource_type": by_type,
+        "requests": requests,
+    }
+
+async def _collect_performance(page, request_tasks):
+    results = await asyncio.gather(*request_tasks, return_exceptions=True)
+    return {
+        "navigation": await page.evaluate(NAVIGATION_TIMING_SCRIPT),
+        "web_vitals": await page.evaluate("() => window.__webVitals || null"),
+        "network": _network_summary([r for r in results if isinstance(r, dict)]),
+    }
+
+async def _run_script(browser, url: str, script: str, run_dir: Path, capture_logs: bool = False,
+                      screenshots: str = "always", shared_screenshot: Path = None,
+                      instrument: bool = False, trace: bool = False):
+    """
+    Runs a single script in its own browser context and returns its result.
+    """
+    result = _new_result()
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    run_dir.mkdir(parents=True, exist_ok=True)
+    extra_paths = [shared_screenshot] if shared_screenshot else []
+
+    context = await browser.new_context()
+    if trace:
+        await context.tracing.start(screenshots=True, snapshots=True, sources=False)
+    page = await context.new_page()
+    script_path = None
+
+    # Record page and network timings if requested
+    request_tasks = []
+    if instrument:
+        await page.add_init_script(WEB_VITALS_INIT_SCRIPT)
+        page.on("requestfinished", lambda request: request_tasks.append(asyncio.ensure_future(_request_record(request))))
+
+    # Store console logs if requested
+    console_logs = []
+    if capture_logs:
+        page.on("console", lambda msg: console_logs.append(f"{msg.type}: {msg.text}"))
+
+    try:
+        # Navigate to URL first
+        await page.goto(url, wait_until="networkidle", timeout=30000)
+
+        # Decode script if base64 encoded
+        if script.startswith('base64:'):
+            script = base64.b64decode(script[7:]).decode('utf-8')
+
+        # Add proper indentation to the script
+        indented_script = ""
+        for line in script.split('\n'):
+            if line.strip():
+                indented_script += "    " + line + "\n"
+            else:
+                indented_script += "\n"
+
+        # Create test script with proper indentation
+        test_script = f"""async def run_test(page, output_dir):
 {indented_script}"""
 
-                # Write the test script to a file for debugging
-                test_script_path = run_dir / "test_script.py"
-                with open(test_script_path, "w") as f:
-                    f.write(test_script)
-
-                # Save script to temp file for execution
-                with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as f:
-                    f.write(test_script)
-                    script_path = f.name
-
-                # Import and execute the script
-                import importlib.util
-                spec = importlib.util.spec_from_file_location("dynamic_script", script_path)
-                module = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(module)
-                
-                # Run the test
-                output = await module.run_test(page, str(run_dir))
-                if output is not None:
-                    result["data"]["output"] = output
-                
-                # Take a screenshot if none were taken
-                screenshot_files = list(run_dir.glob('*.{png,jpg,jpeg}'))
-                if not screenshot_files:
-                    final_screenshot = run_dir / f"final_{timestamp}.png"
-                    await page.screenshot(
-                        path=str(final_screenshot),
-                        full_page=True,
-                        type="jpeg",
-                        quality = 50
-                    )
-                    result["data"]["screenshots"].append(str(final_screenshot))
-
-                    # Save additional screenshot to .screenshot folder
-                    await page.screenshot(
-                        path=str(screenshot_dir / "screenshot.jpeg"),
-                        full_page=True,
-                        type="jpeg",
-                        quality = 50
-                    )
-                else:
-                    result["data"]["screenshots"].extend(str(f) for f in screenshot_files)
+        # Write the test script to a file for debugging
+        test_script_path = run_dir / "test_script.py"
+        with open(test_script_path, "w") as f:
+            f.write(test_script)
 
-                # Save console logs if captured
-                if capture_logs and console_logs:
-                    log_path = run_dir / f"console_{timestamp}.log"
-                    with open(log_path, "w", encoding="utf-8") as f:
-                        f.write("\n".join(console_logs))
-                    result["data"]["console_logs"].append(str(log_path))
+        # Save script to temp file for execution
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as f:
+            f.write(test_script)
+            script_path = f.name
 
-            except Exception as e:
-                result["status"] = "error"
-                result["data"]["error"] = f"Script error: {str(e)}"
-                error_screenshot = run_dir / f"error_{timestamp}.png"
-                await page.screenshot(
-                        path=str(error_screenshot),
-                        full_page=True,
-                        type="jpeg",
-                        quality = 50
-                    )
+        # Import and execute the script
+        spec = importlib.util.spec_from_file_location("dynamic_script", script_path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+
+        # Run the test
+        output = await module.run_test(page, str(run_dir))
+        if output is not None:
+            result["data"]["output"] = output
+
+        # Take a screenshot if none were taken
+        screenshot_files = sorted(f for f in run_dir.iterdir() if f.suffix in ('.png', '.jpg', '.jpeg'))
+        if screenshot_files:
+            result["data"]["screenshots"].extend(str(f) for f in screenshot_files)
+        elif screenshots == "always":
+            final_screenshot = run_dir / f"final_{timestamp}.png"
+            await _save_screenshot(page, [final_screenshot, *extra_paths])
+            result["data"]["screenshots"].append(str(final_screenshot))
+
+    except Exception as e:
+        result["status"] = "error"
+        result["data"]["error"] = f"Script error: {str(e)}"
+        if screenshots != "none":
+            error_screenshot = run_dir / f"error_{timestamp}.png"
+            try:
+                await _save_screenshot(page, [error_screenshot, *extra_paths])
                 result["data"]["screenshots"].append(str(error_screenshot))
+            except Exception:
+                pass
 
-                # Save additional screenshot to .screenshot folder
-                await page.screenshot(
-                        path=str(screenshot_dir / "screenshot.jpeg"),
-                        full_page=True,
-                        type="jpeg",
-                        quality = 50
-                    )
-            
+    finally:
+        if instrument:
+            try:
+                result["data"]["performance"] = await _collect_performance(page, request_tasks)
+            except Exception as e:
+                result["data"]["performance"] = {"error": str(e)}
+        if trace:
+            trace_path = run_dir / f"trace_{timestamp}.zip"
+            try:
+                await context.tracing.stop(path=str(trace_path))
+                result["data"]["trace"] = str(trace_path)
+            except Exception:
+                pass
+        # Save console logs if captured
+        if capture_logs and console_logs:
+            log_path = run_dir / f"console_{timestamp}.log"
+            with open(log_path, "w", encoding="utf-8") as f:
+                f.write("\n".join(console_logs))
+            result["data"]["console_logs"].append(str(log_path))
+        if script_path and os.path.exists(script_path):
+            os.unlink(script_path)
+        await context.close()
+
+    return result
+
+async def execute_playwright_script(url: str, script: str, output_dir: str = ".screenshots", capture_logs: bool = False,
+                                    screenshots: str = "always", instrument: bool = False, trace: bool = False):
+    """
+    Executes a Playwright script and captures outputs.
+    """
+    # Create output directory
+
+    automation_output_dir = 'automation_output'
+
+    os.makedirs(output_dir, exist_ok=True)
+    os.makedirs(automation_output_dir, exist_ok=True)
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    run_dir = Path(automation_output_dir) / timestamp
+
+    screenshot_dir = Path(output_dir)
+    screenshot_dir.mkdir(exist_ok=True)
+
+    try:
+        async with async_playwright() as p:
+            browser = await p.chromium.launch(headless=True)
+            try:
+                return await _run_script(
+                    browser, url, script, run_dir, capture_logs, screenshots,
+                    shared_screenshot=screenshot_dir / "screenshot.jpeg",
+                    instrument=instrument, trace=trace
+                )
             finally:
-                if os.path.exists(script_path):
-                    os.unlink(script_path)
                 await browser.close()
 
     except Exception as e:
+        result = _new_result()
         result["status"] = "error"
         result["data"]["error"] = f"Setup error: {str(e)}"
+        return result
 
-    return result
+async def execute_playwright_batch(url: str, jobs, capture_logs: bool = False, concurrency: int = 4,
+                                   screenshots: str = "on-error", instrument: bool = False, trace: bool = False):
+    """
+    Executes many scripts against one shared browser, each in an isolated context.
+
+    Yields results in completion order, tagged with the job id.
+    """
+    automation_output_dir = 'automation_output'
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    batch_dir = Path(automation_output_dir) / f"batch_{timestamp}"
+    batch_dir.mkdir(parents=True, exist_ok=True)
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def run_job(index, job):
+            job_id = str(job.get("id", index))
+            async with semaphore:
+                try:
+                    result = await _run_script(
+                        browser, job.get("url", url), job["script"], batch_dir / _job_dir_name(index, job_id),
+                        capture_logs, screenshots, instrument=instrument, trace=trace
+                    )
+                except Exception as e:
+                    result = _new_result()
+                    result["status"] = "error"
+                    result["data"]["error"] = f"Setup error: {str(e)}"
+            result["id"] = job_id
+            return result
+
+        try:
+            tasks = [asyncio.create_task(run_job(i, job)) for i, job in enumerate(jobs)]
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            await browser.close()
+
+def _read_batch(path: str):
+    """Read batch jobs as JSON lines: {"script": ..., "url": optional, "id": optional}"""
+    f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        return [json.loads(line) for line in f if line.strip()]
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+async def _print_batch(args):
+    async for result in execute_playwright_batch(
+        args.url,
+        _read_batch(args.batch),
+        args.capture_logs,
+        args.concurrency,
+        args.screenshots or "on-error",
+        args.instrument,
+        args.trace
+    ):
+        print(json.dumps(result), flush=True)
 
 def main():
     parser = argparse.ArgumentParser(description="Execute Playwright automation script")
     parser.add_argument("url", help="URL to automate")
-    parser.add_argument("--script", required=True, help="Playwright script to execute (plain text or base64 encoded with 'base64:' prefix)")
+    parser.add_argument("--script", help="Playwright script to execute (plain text or base64 encoded with 'base64:' prefix)")
+    parser.add_argument("--batch", help="JSON-lines file of scripts to run in one browser ('-' for stdin); results are printed as JSON lines")
+    parser.add_argument("--concurrency", type=int, default=4, help="Number of scripts to run at once in batch mode")
+    parser.add_argument("--screenshots", choices=SCREENSHOT_MODES,
+                        help="When to take a screenshot if the script took none (default: always, or on-error in batch mode)")
     parser.add_argument("--output", "-o", default=".screenshots",
                         help="Output directory for screenshots and logs")
     parser.add_argument("--capture-logs", action="store_true", help="Capture console logs")
-    
+    parser.add_argument("--instrument", action="store_true",
+                        help="Report navigation timing, Web Vitals and network request timings/sizes")
+    parser.add_argument("--trace", action="store_true", help="Save a Playwright trace for each script")
+
     args = parser.parse_args()
-    
+    if bool(args.script) == bool(args.batch):
+        parser.error("exactly one of --script or --batch is required")
+
+    if args.batch:
+        asyncio.run(_print_batch(args))
+        return
+
     result = asyncio.run(execute_playwright_script(
         args.url,
         args.script,
         args.output,
-        args.capture_logs
+        args.capture_logs,
+        args.screenshots or "always",
+        args.instrument,
+        args.trace
     ))
-    
+
     print(json.dumps(result))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -3,12 +3,16 @@ import requests
 import unittest
 import json
 import base64
+import gzip
 import os
 import time
 from datetime import datetime
 
-# Get the backend URL from the frontend .env file
-BACKEND_URL = "https://82c8be2c-ea26-474c-a6cc-4a2ac80cfaa2.preview.emergentagent.com/api"
+# Get the backend URL from the environment, e.g. a local server replaying an LLM cassette
+BACKEND_URL = os.environ.get(
+    "BACKEND_URL",
+    "https://82c8be2c-ea26-474c-a6cc-4a2ac80cfaa2.preview.emergentagent.com/api"
+)
 
 class BackendAPITest(unittest.TestCase):
     """Test suite for the AI Assistant Backend API"""
@@ -334,6 +338,58 @@ class BackendAPITest(unittest.TestCase):
         
         print("✅ MongoDB integration structure test passed")
 
+    def test_09_export_import_round_trip(self):
+        """Test that exported sessions can be imported back unchanged"""
+        print("\n--- Testing Session Export/Import ---")
+        
+        create_response = requests.post(f"{BACKEND_URL}/sessions")
+        self.assertEqual(create_response.status_code, 200, "Failed to create session for export test")
+        self.session_id = create_response.json()["id"]
+        chat_response = requests.post(
+            f"{BACKEND_URL}/chat",
+            json={"message": "Say hello in one word.", "sessionId": self.session_id}
+        )
+        self.assertEqual(chat_response.status_code, 200, "Chat request failed")
+        original = requests.get(f"{BACKEND_URL}/sessions/{self.session_id}").json()
+        
+        def session_lines(body):
+            lines = [json.loads(line) for line in body.decode("utf-8").splitlines() if line.strip()]
+            return [line for line in lines if line.get("id") == self.session_id or line.get("sessionId") == self.session_id]
+        
+        # Plain and compressed exports carry the same records
+        plain = requests.get(f"{BACKEND_URL}/export", stream=True)
+        self.assertEqual(plain.status_code, 200, "Export failed")
+        plain_lines = session_lines(plain.raw.read())
+        compressed = requests.get(f"{BACKEND_URL}/export", params={"compress": "true"}, stream=True)
+        self.assertEqual(compressed.status_code, 200, "Compressed export failed")
+        self.assertEqual(compressed.headers["Content-Type"], "application/gzip")
+        self.assertNotIn("Content-Encoding", compressed.headers)
+        compressed_body = compressed.raw.read()
+        self.assertEqual(compressed_body[:2], b"\x1f\x8b", "Compressed export is not gzip data")
+        self.assertEqual(session_lines(gzip.decompress(compressed_body)), plain_lines)
+        self.assertEqual(plain_lines[0]["type"], "session")
+        self.assertEqual(len(plain_lines), 1 + len(original["messages"]))
+        print(f"✅ Exported session with {len(original['messages'])} messages")
+        
+        # Delete the session and restore it from the compressed export
+        requests.delete(f"{BACKEND_URL}/sessions/{self.session_id}")
+        import_body = gzip.compress("".join(json.dumps(line) + "\n" for line in plain_lines).encode("utf-8"))
+        import_response = requests.post(
+            f"{BACKEND_URL}/import",
+            data=import_body,
+            headers={"Content-Type": "application/x-ndjson"}
+        )
+        self.assertEqual(import_response.status_code, 200, "Import failed")
+        self.assertEqual(import_response.json(), {"sessions": 1, "messages": len(original["messages"])})
+        
+        restored = requests.get(f"{BACKEND_URL}/sessions/{self.session_id}").json()
+        self.assertEqual(restored["title"], plain_lines[0]["title"])
+        self.assertEqual(
+            [(m["id"], m["type"], m["content"]) for m in restored["messages"]],
+            [(m["id"], m["type"], m["content"]) for m in original["messages"]]
+        )
+        print("✅ Session export/import round trip passed")
+
 if __name__ == "__main__":
     # Run the tests in order
     unittest.main(verbosity=2)
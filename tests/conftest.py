@@ -0,0 +1,11 @@
+import os
+import sys
+from pathlib import Path
+
+# server.py is run from backend/, so make its module importable the same way
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "punter613_ai_app_test")
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
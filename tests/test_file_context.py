@@ -0,0 +1,102 @@
+import unittest
+from unittest import mock
+
+import server
+
+
+class FakeFiles:
+    def __init__(self, files):
+        self.files = files
+        self.projections = []
+
+    async def find_one(self, query, projection=None):
+        self.projections.append(projection)
+        doc = self.files.get(query["id"])
+        if not doc:
+            return None
+        return {k: v for k, v in doc.items() if projection is None or projection.get(k)}
+
+
+def _b64(data: bytes) -> str:
+    return server.base64.b64encode(data).decode("ascii")
+
+
+class BuildFilePartsTest(unittest.IsolatedAsyncioTestCase):
+    """Tests for attaching uploaded files to prompts"""
+
+    def setUp(self):
+        self.files = files = FakeFiles({
+            "txt": {"filename": "notes.txt", "content_type": "text/plain", "text_content": "x" * 100},
+            "pdf": {"filename": "spec.pdf", "content_type": "application/pdf", "content": _b64(b"%PDF-1.4")},
+            "png": {"filename": "shot.png", "content_type": "image/png", "content": _b64(b"\x89PNG")},
+            "bin": {"filename": "blob.bin", "content_type": "application/octet-stream", "text_content": ""},
+        })
+        patches = [
+            mock.patch.object(server, "db", mock.Mock(files=files)),
+            mock.patch.object(server, "file_cache", server.OrderedDict()),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    async def test_pdf_and_images_are_inline_parts(self):
+        parts = await server.build_file_parts(["pdf", "png"])
+        self.assertEqual(parts, [
+            {"mime_type": "application/pdf", "data": b"%PDF-1.4"},
+            {"mime_type": "image/png", "data": b"\x89PNG"},
+        ])
+
+    async def test_text_is_truncated_to_budget(self):
+        with mock.patch.object(server, "FILE_CONTEXT_TOKEN_BUDGET", 10):
+            parts = await server.build_file_parts(["txt"])
+        self.assertIn("x" * 40 + "\n```\n[...truncated]", parts[0])
+        self.assertNotIn("x" * 41, parts[0])
+
+    async def test_duplicates_and_unsupported_files_are_skipped(self):
+        parts = await server.build_file_parts(["png", "bin", "png", "missing"])
+        self.assertEqual(len(parts), 1)
+
+    async def test_blob_is_only_fetched_for_inline_types(self):
+        await server.build_file_parts(["txt"])
+        self.assertFalse(any("content" in p for p in self.files.projections))
+        await server.build_file_parts(["png"])
+        self.assertIn({"_id": 0, "content": 1}, self.files.projections)
+
+    async def test_expired_files_are_dropped_from_cache(self):
+        self.files.files["old"] = {
+            "filename": "old.txt", "content_type": "text/plain", "text_content": "old",
+            "uploaded_at": server.datetime.utcnow() - server.timedelta(days=2)
+        }
+        with mock.patch.object(server, "FILE_RETENTION_DAYS", 3):
+            self.assertEqual(len(await server.build_file_parts(["old"])), 1)
+        with mock.patch.object(server, "FILE_RETENTION_DAYS", 1):
+            self.assertEqual(await server.build_file_parts(["old"]), [])
+            self.assertNotIn("old", server.file_cache)
+
+    async def test_inline_byte_limit(self):
+        with mock.patch.object(server, "INLINE_FILE_BYTES_LIMIT", 5):
+            parts = await server.build_file_parts(["pdf", "png"])
+        self.assertEqual(parts, [{"mime_type": "image/png", "data": b"\x89PNG"}])
+
+
+class HistoryAttachmentTest(unittest.IsolatedAsyncioTestCase):
+    """Files from earlier turns stay in the model context"""
+
+    async def test_follow_up_reattaches_earlier_files(self):
+        history = [
+            server.Message(type="user", content="look at this", fileInfo={"fileIds": ["a"]}),
+            server.Message(type="assistant", content="done"),
+        ]
+        build = mock.AsyncMock(return_value=["FILE"])
+        send = mock.AsyncMock(return_value="reply")
+        with mock.patch.object(server, "build_file_parts", build), \
+                mock.patch.object(server, "send_llm_message", send), \
+                mock.patch.object(server, "semantic_cache", None):
+            reply = await server.generate_ai_response("and line 3?", history, ["b"])
+        self.assertEqual(reply, ("reply", False))
+        build.assert_awaited_once_with(["b", "a"])
+        self.assertEqual(send.await_args.args[2], ["FILE", "and line 3?"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+from unittest import mock
+
+import server
+
+
+class FakeSessions:
+    """Answers filtered distinct queries from an in-memory list of session documents"""
+
+    def __init__(self, sessions):
+        self.sessions = sessions
+        self.queries = []
+
+    async def distinct(self, field, query=None):
+        self.queries.append((field, query))
+        wanted = set(query[field]["$in"]) if query else None
+        values = set()
+        for session in self.sessions:
+            for msg in session.get("messages", []):
+                file_info = msg.get("fileInfo") or {}
+                key = field.rsplit(".", 1)[-1]
+                found = file_info.get(key)
+                found = found if isinstance(found, list) else [found] if found else []
+                values.update(v for v in found if wanted is None or v in wanted)
+        return list(values)
+
+
+class ReferencedFileIdsTest(unittest.IsolatedAsyncioTestCase):
+    """Tests for finding which uploads are still referenced"""
+
+    async def test_only_candidates_are_queried_and_returned(self):
+        sessions = FakeSessions([
+            {"messages": [{"fileInfo": {"fileId": "a"}}]},
+            {"messages": [{"fileInfo": {"fileIds": ["b", "z"]}}]},
+        ])
+        with mock.patch.object(server, "db", mock.Mock(sessions=sessions)):
+            referenced = await server._referenced_file_ids({"a", "b", "c"})
+        self.assertEqual(referenced, {"a", "b"})
+        for field, query in sessions.queries:
+            self.assertEqual(set(query[field]["$in"]), {"a", "b", "c"})
+
+    def test_session_file_ids(self):
+        session = {"messages": [
+            {"fileInfo": {"fileId": "a"}},
+            {"fileInfo": {"fileIds": ["b", "c"]}},
+            {"fileInfo": None},
+        ]}
+        self.assertEqual(server._session_file_ids(session), {"a", "b", "c"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import gzip
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import google.generativeai as genai
+
+import server
+
+KEY_SCRIPT = """
+import google.generativeai as genai
+import server
+print(server.LLMCassette("unused", "off", "none", 0).key(
+    "models/gemini-2.0-flash-exp",
+    [{"role": "user", "parts": [{"text": "hi"}]}],
+    [{"mime_type": "image/png", "data": b"\\x89PNG"}, "what is this?"],
+    genai.types.GenerationConfig(temperature=0.7, max_output_tokens=1500),
+))
+"""
+
+
+class LLMCassetteTest(unittest.IsolatedAsyncioTestCase):
+    """Tests for recording and replaying LLM traffic"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "cassette.jsonl.gz"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _record(self, records):
+        recorder = server.LLMCassette(str(self.path), "record", "none", 0)
+        for key, response, latency_ms in records:
+            recorder.record(key, "prompt", response, latency_ms)
+
+    def _replayer(self, latency="none", seed=0):
+        return server.LLMCassette(str(self.path), "replay", latency, seed)
+
+    def test_key_is_stable_across_processes(self):
+        keys = []
+        for hash_seed in ("1", "2"):
+            env = {**os.environ, "PYTHONHASHSEED": hash_seed, "PYTHONWARNINGS": "ignore"}
+            output = subprocess.run(
+                [sys.executable, "-c", KEY_SCRIPT], cwd=server.ROOT_DIR, env=env,
+                capture_output=True, text=True, check=True
+            ).stdout
+            keys.append(output.strip().splitlines()[-1])
+        self.assertEqual(keys[0], keys[1])
+        self.assertEqual(keys[0], server.LLMCassette(str(self.path), "off", "none", 0).key(
+            "models/gemini-2.0-flash-exp",
+            [{"role": "user", "parts": [{"text": "hi"}]}],
+            [{"mime_type": "image/png", "data": b"\x89PNG"}, "what is this?"],
+            genai.types.GenerationConfig(temperature=0.7, max_output_tokens=1500),
+        ))
+
+    async def test_identical_keys_replay_in_order(self):
+        self._record([("k", "first", 10), ("k", "second", 20)])
+        cassette = self._replayer()
+        self.assertEqual(await cassette.replay("k"), "first")
+        self.assertEqual(await cassette.replay("k"), "second")
+        self.assertEqual(await cassette.replay("k"), "second")
+
+    async def test_miss_raises(self):
+        self._record([("k", "first", 10)])
+        with self.assertRaises(server.CassetteMissError):
+            await self._replayer().replay("other")
+
+    async def test_reads_appended_gzip_members(self):
+        self._record([("a", "one", 10)])
+        self._record([("b", "two", 20)])
+        with open(self.path, "ab") as f:
+            f.write(gzip.compress(json.dumps({"key": "c", "response": "three", "latency_ms": 30}).encode() + b"\n"))
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read().count(b"\x1f\x8b\x08"), 3)
+        cassette = self._replayer()
+        self.assertEqual([await cassette.replay(k) for k in "abc"], ["one", "two", "three"])
+
+    async def test_latency_modes(self):
+        self._record([("a", "one", 100), ("b", "two", 250), ("c", "three", 400)])
+        with mock.patch.object(server.asyncio, "sleep", new=mock.AsyncMock()) as sleep:
+            await self._replayer("none").replay("a")
+            sleep.assert_not_called()
+
+            await self._replayer("recorded").replay("b")
+            sleep.assert_awaited_once_with(0.25)
+
+            sampled = []
+            for _ in range(2):
+                sleep.reset_mock()
+                cassette = self._replayer("sampled", seed=7)
+                for _ in range(5):
+                    await cassette.replay("a")
+                sampled.append([call.args[0] for call in sleep.await_args_list])
+        self.assertEqual(sampled[0], sampled[1])
+        self.assertTrue(set(sampled[0]) <= {0.1, 0.25, 0.4})
+
+    async def test_replay_miss_is_not_hidden_by_fallback_reply(self):
+        cassette = server.LLMCassette(str(self.path), "replay", "none", 0)
+        with mock.patch.object(server, "llm_cassette", cassette), \
+                mock.patch.object(server, "semantic_cache", None):
+            with self.assertRaises(server.CassetteMissError):
+                await server.generate_ai_response("hello", [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import asyncio
+import time
+import unittest
+from unittest import mock
+
+from google.api_core import exceptions as google_exceptions
+
+import server
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    """Tests for the LLM circuit breaker"""
+
+    def setUp(self):
+        self.breaker = server.CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+    def test_opens_after_threshold(self):
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, "closed")
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, "open")
+        self.assertFalse(self.breaker.allow())
+
+    def test_half_open_allows_single_trial(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.breaker.opened_at -= 61
+        self.assertEqual(self.breaker.state, "half_open")
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+
+    def test_failed_trial_reopens(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.breaker.opened_at -= 61
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, "open")
+
+    def test_success_closes(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.breaker.opened_at -= 61
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, "closed")
+        self.assertEqual(self.breaker.failures, 0)
+
+
+class SlowChat:
+    def __init__(self, delay):
+        self.delay = delay
+
+    def send_message(self, *args, **kwargs):
+        time.sleep(self.delay)
+        return mock.Mock(text="late")
+
+
+class FlakyChat:
+    def __init__(self, errors):
+        self.errors = errors
+
+    def send_message(self, *args, **kwargs):
+        if self.errors:
+            raise self.errors.pop(0)
+        return mock.Mock(text="ok")
+
+
+class SendLLMMessageTest(unittest.IsolatedAsyncioTestCase):
+    """Tests for deadlines and breaker bookkeeping around LLM calls"""
+
+    def setUp(self):
+        self.breaker = server.CircuitBreaker(failure_threshold=5, reset_timeout=60)
+        patches = [
+            mock.patch.object(server, "llm_breaker", self.breaker),
+            mock.patch.object(server, "LLM_MAX_ATTEMPTS", 10),
+            mock.patch.object(server, "LLM_TIMEOUT_SECONDS", 0.2),
+            mock.patch.object(server, "LLM_CALL_DEADLINE_SECONDS", 0.5),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    async def test_overall_deadline_bounds_retries(self):
+        model = mock.Mock()
+        model.start_chat.return_value = SlowChat(0.3)
+        started = time.monotonic()
+        with self.assertRaises(asyncio.TimeoutError):
+            await server._send_llm_message_live(model, [], "hi", None)
+        self.assertLess(time.monotonic() - started, 0.9)
+        self.assertEqual(self.breaker.failures, 1)
+
+    async def test_bad_gateway_counts_as_breaker_failure(self):
+        model = mock.Mock()
+        model.start_chat.return_value = FlakyChat([google_exceptions.BadGateway("bad gateway")])
+        with mock.patch.object(server, "LLM_MAX_ATTEMPTS", 1):
+            with self.assertRaises(google_exceptions.BadGateway):
+                await server._send_llm_message_live(model, [], "hi", None)
+        self.assertEqual(self.breaker.failures, 1)
+
+    async def test_bad_gateway_is_retried(self):
+        model = mock.Mock()
+        model.start_chat.return_value = FlakyChat([google_exceptions.BadGateway("bad gateway")])
+        with mock.patch.object(server, "LLM_CALL_DEADLINE_SECONDS", 5):
+            self.assertEqual(await server._send_llm_message_live(model, [], "hi", None), "ok")
+        self.assertEqual(model.start_chat.call_count, 2)
+        self.assertEqual(self.breaker.failures, 0)
+
+    async def test_cancelled_trial_releases_half_open_breaker(self):
+        self.breaker.opened_at = time.monotonic() - 61
+        model = mock.Mock()
+        model.start_chat.return_value = SlowChat(0.15)
+        task = asyncio.create_task(server._send_llm_message_live(model, [], "hi", None))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertFalse(self.breaker.trial_in_flight)
+        self.assertTrue(self.breaker.allow())
+
+
+class ContextMessagesTest(unittest.TestCase):
+    """Tests for excluding fallback replies from model context"""
+
+    def test_error_replies_and_their_prompts_are_dropped(self):
+        history = [
+            server.Message(type="user", content="first"),
+            server.Message(type="assistant", content="answer"),
+            server.Message(type="user", content="second"),
+            server.Message(type="assistant", content="oops", isError=True),
+            server.Message(type="user", content="third"),
+            server.Message(type="assistant", content=server.FALLBACK_PREFIX + " Let me try"),
+        ]
+        context = server._context_messages(history)
+        self.assertEqual([m.content for m in context], ["first", "answer"])
+
+    def test_regular_history_is_kept(self):
+        history = [
+            server.Message(type="user", content="q"),
+            server.Message(type="assistant", content="a"),
+        ]
+        self.assertEqual(server._context_messages(history), history)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+
+import server
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.docs:
+            yield dict(doc)
+
+
+class FakeBlocks:
+    def __init__(self, blocks):
+        self.blocks = blocks
+
+    def find(self, query, projection=None):
+        ids = set(query["id"]["$in"])
+        return FakeCursor([{"id": k, "content": v} for k, v in self.blocks.items() if k in ids])
+
+
+class FakeBlockStore:
+    """Stale block ids, with deletes recorded rather than applied"""
+
+    def __init__(self, ids):
+        self.ids = ids
+        self.deleted = []
+
+    def find(self, query, projection=None):
+        return FakeCursor([{"id": block_id} for block_id in self.ids])
+
+    async def delete_many(self, query):
+        self.deleted.extend(query["id"]["$in"])
+        return mock.Mock(deleted_count=len(query["id"]["$in"]))
+
+
+class FakeBlockRefs:
+    def __init__(self, referenced):
+        self.referenced = referenced
+        self.queries = []
+
+    async def distinct(self, field, query):
+        self.queries.append(query[field]["$in"])
+        return [block_id for block_id in query[field]["$in"] if block_id in self.referenced]
+
+
+class MessageCompactionTest(unittest.IsolatedAsyncioTestCase):
+    """Tests for compacting and expanding stored messages"""
+
+    async def test_round_trip_with_shared_code_block(self):
+        code = "```python\n" + "print('hello')\n" * 100 + "```"
+        content = f"First copy:\n{code}\n\nSecond copy:\n{code}\n"
+        compressed, blocks = server._compact_content(content)
+        self.assertEqual(len(blocks), 1)
+        self.assertLess(len(compressed), len(content))
+
+        session = {"messages": [
+            {"id": "m1", "type": "assistant", "content": "", "compacted": True,
+             "compressedContent": compressed, "blockRefs": list(blocks)},
+            {"id": "m2", "type": "user", "content": "short", "compacted": True},
+        ]}
+        with mock.patch.object(server, "db", mock.Mock(content_blocks=FakeBlocks(blocks))):
+            await server.expand_messages(session)
+
+        self.assertEqual(session["messages"][0], {"id": "m1", "type": "assistant", "content": content})
+        self.assertEqual(session["messages"][1], {"id": "m2", "type": "user", "content": "short"})
+
+    async def test_unreferenced_blocks_are_checked_in_batches(self):
+        blocks = FakeBlockStore([f"b{i}" for i in range(5)])
+        sessions = FakeBlockRefs({"b1", "b4"})
+        with mock.patch.object(server, "db", mock.Mock(content_blocks=blocks, sessions=sessions)), \
+                mock.patch.object(server, "CONTENT_BLOCK_GC_BATCH_SIZE", 2):
+            deleted = await server._delete_unreferenced_blocks(datetime(2024, 5, 1))
+        self.assertEqual(deleted, 3)
+        self.assertEqual(blocks.deleted, ["b0", "b2", "b3"])
+        self.assertEqual(sessions.queries, [["b0", "b1"], ["b2", "b3"], ["b4"]])
+
+    def test_small_code_blocks_stay_inline(self):
+        content = "```js\nconsole.log(1)\n```"
+        _, blocks = server._compact_content(content)
+        self.assertEqual(blocks, {})
+
+    def test_legacy_string_timestamps(self):
+        self.assertEqual(server._as_datetime("2024-05-01T10:00:00Z"), datetime(2024, 5, 1, 10, 0, 0))
+        self.assertEqual(
+            server._as_datetime(datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)),
+            datetime(2024, 5, 1, 12, 0)
+        )
+        self.assertIsNone(server._as_datetime("not a date"))
+        self.assertIsNone(server._as_datetime(None))
+
+
+if __name__ == "__main__":
+    unittest.main()
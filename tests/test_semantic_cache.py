@@ -0,0 +1,61 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import server
+
+
+class SemanticCacheTest(unittest.TestCase):
+    """Tests for the semantic response cache"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "cache.npz"
+        self.cache = server.SemanticCache(str(self.path), max_entries=10, threshold=server.SEMANTIC_CACHE_THRESHOLD)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_near_duplicate_hits(self):
+        self.cache.add("how do I center a div", "Use flexbox")
+        self.assertEqual(self.cache.lookup("How can I center a div?"), "Use flexbox")
+        self.assertEqual(self.cache.lookup("how to center a div"), "Use flexbox")
+
+    def test_extra_qualifier_does_not_hit(self):
+        self.cache.add("how do I delete a git branch", "git branch -d name")
+        self.cache.add("how do I center a div", "Use flexbox")
+        self.assertIsNone(self.cache.lookup("how do I delete a remote git branch"))
+        self.assertIsNone(self.cache.lookup("how to center text in a div"))
+        self.assertIsNone(self.cache.lookup("center div css"))
+
+    def test_negation_does_not_hit(self):
+        self.cache.add("is it safe to delete node_modules", "Yes")
+        self.assertIsNone(self.cache.lookup("is it unsafe to delete node_modules"))
+        self.assertIsNone(self.cache.lookup("is it not safe to delete node_modules"))
+
+    def test_different_numbers_do_not_hit(self):
+        self.cache.add("convert 10 miles to km", "16.09 km")
+        self.assertIsNone(self.cache.lookup("convert 100 miles to km"))
+        self.assertEqual(self.cache.lookup("Convert 10 miles to km?"), "16.09 km")
+
+    def test_unrelated_prompt_misses(self):
+        self.cache.add("how do I center a div", "Use flexbox")
+        self.assertIsNone(self.cache.lookup("how to sort a list in python"))
+
+    def test_lru_eviction(self):
+        cache = server.SemanticCache(str(self.path), max_entries=2, threshold=0.99)
+        cache.add("first prompt", "1")
+        cache.add("second prompt", "2")
+        cache.lookup("first prompt")
+        cache.add("third prompt", "3")
+        self.assertEqual(sorted(e["prompt"] for e in cache.entries), ["first prompt", "third prompt"])
+
+    def test_persistence(self):
+        self.cache.add("how do I center a div", "Use flexbox")
+        self.cache.save()
+        reloaded = server.SemanticCache(str(self.path), max_entries=10, threshold=server.SEMANTIC_CACHE_THRESHOLD)
+        self.assertEqual(reloaded.lookup("how do I center a div"), "Use flexbox")
+
+
+if __name__ == "__main__":
+    unittest.main()
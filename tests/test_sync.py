@@ -0,0 +1,33 @@
+import unittest
+from datetime import datetime, timedelta
+
+import server
+
+
+class SyncCursorTest(unittest.TestCase):
+    """Tests for the delta sync cursor"""
+
+    def setUp(self):
+        self.now = datetime(2026, 1, 1, 12, 0, 0)
+
+    def test_no_counter(self):
+        self.assertEqual(server.sync_cursor(None, self.now), 0)
+
+    def test_no_writes_in_flight(self):
+        self.assertEqual(server.sync_cursor({"seq": 42, "inflight": []}, self.now), 42)
+
+    def test_cursor_stays_below_unfinished_write(self):
+        counter = {"seq": 12, "inflight": [
+            {"seq": 10, "at": self.now},
+            {"seq": 12, "at": self.now},
+        ]}
+        self.assertEqual(server.sync_cursor(counter, self.now), 9)
+
+    def test_abandoned_reservation_is_ignored(self):
+        stale = self.now - timedelta(seconds=server.SYNC_RESERVATION_TIMEOUT_SECONDS + 1)
+        counter = {"seq": 12, "inflight": [{"seq": 5, "at": stale}]}
+        self.assertEqual(server.sync_cursor(counter, self.now), 12)
+
+
+if __name__ == "__main__":
+    unittest.main()